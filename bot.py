@@ -1,39 +1,174 @@
 import asyncio
 import base64
+import contextvars
+import cProfile
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import html
+import io
+import itertools
 import json
 import logging
+import os
+import pstats
 import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
-
-from aiogram import Bot, Dispatcher, F
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
 from aiogram.filters import Command
 from aiogram.types import (
+    BufferedInputFile,
     CallbackQuery,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
+    Update,
+    User,
 )
 
 # ─────────────────────────────────────────────
 #  Конфиг
 # ─────────────────────────────────────────────
-TOKEN = "8500266882:AAHTGpChTbUZ-CJ-GydZAWmlGBlshiK5UNk"
+# Несколько ботов в одном процессе: общий каталог и БД, свои сессии.
+# Первый токен — основной (от его имени идут отчёты и рассылки по умолчанию)
+TOKENS = [
+    "8500266882:AAHTGpChTbUZ-CJ-GydZAWmlGBlshiK5UNk",
+]
 ADMINS = {"asd123dad", "venter8"}
 DEFAULT_EMOJI_ID = "5285430309720966085"
 DEFAULT_EMOJI_NAME = "Стандартный"
 MAX_ADDITIONS = 5
 NO_EMOJI = "__NO_EMOJI__"
 
+# Admission control: сколько хендлеров работает одновременно
+# и сколько апдейтов может ждать своей очереди
+MAX_IN_FLIGHT = 32
+MAX_QUEUE = 256
+
+# Апдейты дольше этого порога логируются с полным деревом спанов
+SLOW_UPDATE_MS = 700
+MAX_PROFILE_SECONDS = 60
+
+# Bot API клиент. BOT_API_BASE — адрес локального Bot API сервера
+# (например "http://localhost:8081"), None — api.telegram.org
+BOT_API_BASE: Optional[str] = None
+# Весь трафик идёт на один хост (api.telegram.org или BOT_API_BASE),
+# поэтому лимит на хост совпадает с общим — иначе реальный потолок ниже
+API_POOL_LIMIT = 128          # всего соединений в пуле
+API_POOL_LIMIT_PER_HOST = API_POOL_LIMIT
+API_KEEPALIVE = 60            # секунд держим простаивающее соединение
+API_DNS_TTL = 300             # секунд кешируем DNS
+API_TIMEOUT = 15              # таймаут обычных запросов
+POLLING_TIMEOUT = 30          # long-poll getUpdates (к нему добавляется API_TIMEOUT)
+
+# Автобэкапы в локальную папку: дельта раз в BACKUP_INTERVAL секунд,
+# полный снимок раз в BACKUP_FULL_EVERY дельт, храним BACKUP_KEEP_FULL полных
+BACKUP_DIR = "backups"
+BACKUP_INTERVAL = 300
+BACKUP_FULL_EVERY = 12
+BACKUP_KEEP_FULL = 5
+
+# Рассылки: темп ниже глобального лимита Telegram (~30/с),
+# чтобы оставить запас интерактивному трафику
+BROADCAST_RATE = 20           # сообщений в секунду
+BROADCAST_BATCH = 50          # получателей за одну выборку из БД
+BROADCAST_YIELD_IN_FLIGHT = MAX_IN_FLIGHT // 2  # выше — рассылка ждёт
+BROADCAST_ERROR_BACKOFF = 5    # секунд паузы после сбоя воркера
+
+# Запись входящих апдейтов в JSONL для replay.py (None — выключено).
+# id пользователей и чатов заменяются стабильными псевдонимами
+RECORD_UPDATES_PATH: Optional[str] = None
+
+# Аудит: записи копятся в памяти и пишутся пачкой раз в AUDIT_FLUSH_INTERVAL
+# секунд или сразу, как наберётся AUDIT_BATCH
+AUDIT_FLUSH_INTERVAL = 2.0
+AUDIT_BATCH = 200
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+# ─────────────────────────────────────────────
+#  Трейсинг
+# ─────────────────────────────────────────────
+class Span:
+    __slots__ = ("name", "start", "end", "children")
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: list["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def format_tree(self, depth: int = 0) -> str:
+        lines = [f"{'  ' * depth}{self.name}: {self.duration_ms:.1f} ms"]
+        for child in self.children:
+            lines.append(child.format_tree(depth + 1))
+        return "\n".join(lines)
+
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None,
+)
+
+@contextmanager
+def span(name: str):
+    """Дочерний спан текущего апдейта. Вне апдейта ничего не делает."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+def traced(name: str):
+    """Декоратор: оборачивает синхронную функцию в спан."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # ─────────────────────────────────────────────
 #  База данных
 # ─────────────────────────────────────────────
 con = sqlite3.connect(":memory:", check_same_thread=False)
 con.row_factory = sqlite3.Row
 
+_catalog_cache: Optional[list] = None
+
+def invalidate_catalog_cache() -> None:
+    global _catalog_cache
+    _catalog_cache = None
+
 def db_init() -> None:
     cur = con.cursor()
     cur.executescript("""
@@ -49,7 +184,67 @@ def db_init() -> None:
             added_by   TEXT,
             added_at   TEXT
         );
+        CREATE TABLE IF NOT EXISTS users (
+            bot_id     INTEGER NOT NULL,
+            user_id    INTEGER NOT NULL,
+            first_seen TEXT,
+            PRIMARY KEY (bot_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            text       TEXT NOT NULL,
+            target     TEXT NOT NULL,
+            bot_id     INTEGER,
+            created_by INTEGER,
+            created_at TEXT,
+            status     TEXT NOT NULL DEFAULT 'running'
+        );
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL,
+            bot_id       INTEGER NOT NULL,
+            chat_id      INTEGER NOT NULL,
+            status       TEXT NOT NULL DEFAULT 'pending',
+            error        TEXT,
+            sent_at      TEXT,
+            PRIMARY KEY (broadcast_id, bot_id, chat_id)
+        );
+        CREATE INDEX IF NOT EXISTS broadcast_recipients_pending
+            ON broadcast_recipients (broadcast_id, status);
+        -- Аудит изменений каталога и аппруверов: только добавление
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts         TEXT NOT NULL,
+            actor      TEXT,              -- username (или id) на момент действия
+            actor_id   INTEGER,           -- Telegram id; NULL для system
+            action     TEXT NOT NULL,
+            entity     TEXT NOT NULL,
+            entity_id  TEXT,
+            before     TEXT,
+            after      TEXT
+        );
+        CREATE INDEX IF NOT EXISTS audit_log_actor  ON audit_log (actor, id);
+        CREATE INDEX IF NOT EXISTS audit_log_actor_id ON audit_log (actor_id, id);
+        CREATE INDEX IF NOT EXISTS audit_log_entity ON audit_log (entity, entity_id, id);
+        CREATE TRIGGER IF NOT EXISTS audit_log_no_update BEFORE UPDATE ON audit_log
+            BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END;
+        CREATE TRIGGER IF NOT EXISTS audit_log_no_delete BEFORE DELETE ON audit_log
+            BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END;
+        -- Журнал изменений для инкрементальных бэкапов
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl        TEXT NOT NULL,
+            key        TEXT NOT NULL
+        );
     """)
+    # Триггеры журнала изменений — для каждой таблицы из бэкапов
+    for table, key in BACKUP_KEYS.items():
+        for event, ref in (("ins", "NEW"), ("upd", "NEW"), ("del", "OLD")):
+            sql_event = {"ins": "INSERT", "upd": "UPDATE", "del": "DELETE"}[event]
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_{event} AFTER {sql_event} ON {table} "
+                f"BEGIN INSERT INTO change_log (tbl, key) "
+                f"VALUES ('{table}', {_change_key_sql(ref, key)}); END"
+            )
 
     default_emojis = [
         ("5285430309720966085", "Стандартный #1"),
@@ -65,64 +260,595 @@ def db_init() -> None:
         )
 
     con.commit()
+    invalidate_catalog_cache()
 
+@traced("db.get_catalog")
 def db_get_catalog() -> list:
-    return con.execute("SELECT * FROM emoji_catalog ORDER BY added_at").fetchall()
-
-def db_add_emoji(emoji_id: str, name: str, added_by: str) -> None:
-    con.execute(
-        "INSERT OR REPLACE INTO emoji_catalog VALUES (?,?,?,?)",
-        (emoji_id, name, added_by, datetime.utcnow().isoformat()),
-    )
+    # Каталог общий для всех ботов процесса и читается на каждый рендер пикера,
+    # поэтому держим его в памяти и сбрасываем при записи
+    global _catalog_cache
+    if _catalog_cache is None:
+        _catalog_cache = con.execute("SELECT * FROM emoji_catalog ORDER BY added_at").fetchall()
+    return _catalog_cache
+
+@traced("db.add_emoji")
+def db_add_emoji(emoji_id: str, name: str, added_by: str, actor_id: int) -> None:
+    before = con.execute("SELECT * FROM emoji_catalog WHERE emoji_id=?", (emoji_id,)).fetchone()
+    row = (emoji_id, name, added_by, datetime.utcnow().isoformat())
+    con.execute("INSERT OR REPLACE INTO emoji_catalog VALUES (?,?,?,?)", row)
     con.commit()
+    invalidate_catalog_cache()
+    audit.record(added_by, actor_id, "update" if before else "create", "emoji", emoji_id,
+                 before, dict(zip(EMOJI_COLUMNS, row)))
 
+@traced("db.get_approvers")
 def db_get_approvers() -> list:
     return con.execute("SELECT * FROM approvers ORDER BY added_at").fetchall()
 
-def db_add_approver(user_id: int, username: str, added_by: str) -> None:
-    con.execute(
-        "INSERT OR REPLACE INTO approvers VALUES (?,?,?,?)",
-        (user_id, username, added_by, datetime.utcnow().isoformat()),
-    )
+@traced("db.add_approver")
+def db_add_approver(user_id: int, username: str, added_by: str, actor_id: int) -> None:
+    before = con.execute("SELECT * FROM approvers WHERE user_id=?", (user_id,)).fetchone()
+    row = (user_id, username, added_by, datetime.utcnow().isoformat())
+    con.execute("INSERT OR REPLACE INTO approvers VALUES (?,?,?,?)", row)
     con.commit()
+    audit.record(added_by, actor_id, "update" if before else "create", "approver", user_id,
+                 before, dict(zip(APPROVER_COLUMNS, row)))
 
-def db_remove_approver(user_id: int) -> bool:
+@traced("db.remove_approver")
+def db_remove_approver(user_id: int, removed_by: str, actor_id: int) -> bool:
+    before = con.execute("SELECT * FROM approvers WHERE user_id=?", (user_id,)).fetchone()
     cur = con.execute("DELETE FROM approvers WHERE user_id=?", (user_id,))
     con.commit()
+    if before is not None:
+        audit.record(removed_by, actor_id, "delete", "approver", user_id, before, None)
     return cur.rowcount > 0
 
+@traced("db.is_approver")
 def db_is_approver(user_id: int) -> bool:
     row = con.execute("SELECT 1 FROM approvers WHERE user_id=?", (user_id,)).fetchone()
     return row is not None
 
-def db_export() -> str:
-    data = {
-        "emoji_catalog": [dict(r) for r in db_get_catalog()],
-        "approvers":     [dict(r) for r in db_get_approvers()],
-    }
-    return "EMOJI_BACKUP:" + base64.b64encode(json.dumps(data).encode()).decode()
+known_users: set[tuple[int, int]] = set()
+
+@traced("db.remember_user")
+def db_remember_user(bot_id: int, user_id: int) -> None:
+    """Запоминаем пользователя для рассылок. В БД пишем только новых."""
+    if (bot_id, user_id) in known_users:
+        return
+    known_users.add((bot_id, user_id))
+    con.execute(
+        "INSERT OR IGNORE INTO users VALUES (?,?,?)",
+        (bot_id, user_id, datetime.utcnow().isoformat()),
+    )
+    con.commit()
 
-def db_import(raw: str) -> bool:
+@traced("db.create_broadcast")
+def db_create_broadcast(
+    text: str, target: str, bot_id: int, created_by: int,
+    recipients: list[tuple[int, int]],
+) -> int:
+    """recipients: [(bot_id, chat_id)] — каждому пишет бот, которого он запускал."""
+    with con:
+        cur = con.execute(
+            "INSERT INTO broadcasts (text, target, bot_id, created_by, created_at) "
+            "VALUES (?,?,?,?,?)",
+            (text, target, bot_id, created_by, datetime.utcnow().isoformat()),
+        )
+        broadcast_id = cur.lastrowid
+        con.executemany(
+            "INSERT OR IGNORE INTO broadcast_recipients (broadcast_id, bot_id, chat_id) "
+            "VALUES (?,?,?)",
+            [(broadcast_id, r_bot_id, chat_id) for r_bot_id, chat_id in recipients],
+        )
+    return broadcast_id
+
+@traced("db.get_user_recipients")
+def db_get_user_recipients() -> list[tuple[int, int]]:
+    """По одному сообщению на человека: пишет первый бот, с которым он общался."""
+    rows = con.execute(
+        "SELECT MIN(bot_id) AS bot_id, user_id FROM users GROUP BY user_id"
+    ).fetchall()
+    return [(r["bot_id"], r["user_id"]) for r in rows]
+
+@traced("db.get_approver_recipients")
+def db_get_approver_recipients(default_bot_id: int) -> list[tuple[int, int]]:
+    """Аппруверу пишет первый бот, с которым он общался, иначе — default_bot_id."""
+    rows = con.execute(
+        "SELECT COALESCE(MIN(u.bot_id), ?) AS bot_id, a.user_id AS chat_id "
+        "FROM approvers a LEFT JOIN users u ON u.user_id = a.user_id "
+        "GROUP BY a.user_id",
+        (default_bot_id,),
+    ).fetchall()
+    return [(r["bot_id"], r["chat_id"]) for r in rows]
+
+@traced("db.next_broadcast")
+def db_next_broadcast() -> Optional[sqlite3.Row]:
+    return con.execute(
+        "SELECT * FROM broadcasts WHERE status='running' ORDER BY id LIMIT 1"
+    ).fetchone()
+
+@traced("db.running_broadcasts")
+def db_running_broadcasts() -> list:
+    return con.execute("SELECT * FROM broadcasts WHERE status='running' ORDER BY id").fetchall()
+
+@traced("db.pending_recipients")
+def db_pending_recipients(broadcast_id: int, limit: int) -> list[tuple[int, int]]:
+    rows = con.execute(
+        "SELECT bot_id, chat_id FROM broadcast_recipients "
+        "WHERE broadcast_id=? AND status='pending' LIMIT ?",
+        (broadcast_id, limit),
+    ).fetchall()
+    return [(r["bot_id"], r["chat_id"]) for r in rows]
+
+@traced("db.mark_recipients")
+def db_mark_recipients(
+    broadcast_id: int, results: list[tuple[int, int, str, Optional[str]]],
+) -> None:
+    """results: [(bot_id, chat_id, status, error)] — одна транзакция на пачку."""
+    now = datetime.utcnow().isoformat()
+    with con:
+        con.executemany(
+            "UPDATE broadcast_recipients SET status=?, error=?, sent_at=? "
+            "WHERE broadcast_id=? AND bot_id=? AND chat_id=?",
+            [
+                (status, error, now, broadcast_id, bot_id, chat_id)
+                for bot_id, chat_id, status, error in results
+            ],
+        )
+
+@traced("db.set_broadcast_status")
+def db_set_broadcast_status(broadcast_id: int, status: str) -> bool:
+    cur = con.execute(
+        "UPDATE broadcasts SET status=? WHERE id=? AND status='running'",
+        (status, broadcast_id),
+    )
+    con.commit()
+    return cur.rowcount > 0
+
+@traced("db.broadcast_progress")
+def db_broadcast_progress(broadcast_id: int) -> dict[str, int]:
+    rows = con.execute(
+        "SELECT status, COUNT(*) AS n FROM broadcast_recipients "
+        "WHERE broadcast_id=? GROUP BY status",
+        (broadcast_id,),
+    ).fetchall()
+    return {r["status"]: r["n"] for r in rows}
+
+@traced("db.get_broadcast")
+def db_get_broadcast(broadcast_id: int) -> Optional[sqlite3.Row]:
+    return con.execute("SELECT * FROM broadcasts WHERE id=?", (broadcast_id,)).fetchone()
+
+@traced("db.recent_broadcasts")
+def db_recent_broadcasts(limit: int = 5) -> list:
+    return con.execute(
+        "SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+
+BACKUP_PREFIX = "EMOJI_BACKUP:"
+BACKUP_TABLES = ("emoji_catalog", "approvers")
+
+def _iter_backup_json() -> Iterator[str]:
+    """Сериализуем таблицы построчно, не собирая их целиком в списки."""
+    yield "{"
+    for t_idx, table in enumerate(BACKUP_TABLES):
+        yield f'{", " if t_idx else ""}"{table}": ['
+        cur = con.execute(f"SELECT * FROM {table} ORDER BY added_at")
+        for r_idx, row in enumerate(cur):
+            yield (", " if r_idx else "") + json.dumps(dict(row))
+        yield "]"
+    yield "}"
+
+@traced("db.export")
+def db_export() -> str:
+    """Бэкап: JSON → zlib → base64. Тяжёлая работа — вызывать через db_export_async."""
+    comp = zlib.compressobj(9)
+    chunks = [comp.compress(chunk.encode()) for chunk in _iter_backup_json()]
+    chunks.append(comp.flush())
+    return BACKUP_PREFIX + base64.b64encode(b"".join(chunks)).decode()
+
+def decode_backup(raw: str) -> Optional[dict[str, list[tuple]]]:
+    """Декодируем и проверяем бэкап, не трогая БД. None — строка битая."""
     try:
-        if not raw.startswith("EMOJI_BACKUP:"):
-            return False
-        data = json.loads(base64.b64decode(raw[13:]).decode())
-        cur = con.cursor()
-        for row in data.get("emoji_catalog", []):
-            cur.execute(
-                "INSERT OR REPLACE INTO emoji_catalog VALUES (?,?,?,?)",
-                (row["emoji_id"], row["name"], row["added_by"], row["added_at"]),
-            )
-        for row in data.get("approvers", []):
-            cur.execute(
-                "INSERT OR REPLACE INTO approvers VALUES (?,?,?,?)",
-                (row["user_id"], row["username"], row["added_by"], row["added_at"]),
-            )
-        con.commit()
-        return True
+        raw = raw.strip()
+        if not raw.startswith(BACKUP_PREFIX):
+            return None
+        payload = base64.b64decode(raw[len(BACKUP_PREFIX):])
+        # Старые бэкапы — несжатый JSON, новые начинаются с заголовка zlib
+        if payload[:1] == b"\x78":
+            payload = zlib.decompress(payload)
+        data = json.loads(payload.decode())
+        catalog = [
+            (str(r["emoji_id"]), str(r["name"]), r.get("added_by"), r.get("added_at"))
+            for r in data.get("emoji_catalog", [])
+        ]
+        approvers = [
+            (int(r["user_id"]), r.get("username"), r.get("added_by"), r.get("added_at"))
+            for r in data.get("approvers", [])
+        ]
+        return {"emoji_catalog": catalog, "approvers": approvers}
     except Exception as e:
         log.error("import error: %s", e)
+        return None
+
+def diff_backup(
+    data: dict[str, list[tuple]], catalog_before: list, approvers_before: list,
+    actor: str, actor_id: int,
+) -> list[tuple]:
+    """Записи аудита для импорта — только реально изменённые строки.
+    Чистая функция над снимком, поэтому её можно звать из рабочего потока."""
+    entries = []
+    for entity, columns, rows, before_rows in (
+        ("emoji", EMOJI_COLUMNS, data["emoji_catalog"], catalog_before),
+        ("approver", APPROVER_COLUMNS, data["approvers"], approvers_before),
+    ):
+        before_map = {r[0]: r for r in before_rows}
+        for row in rows:
+            before = before_map.get(row[0])
+            after = dict(zip(columns, row))
+            if before is None or dict(before) != after:
+                entries.append(audit_entry(actor, actor_id, "import", entity, row[0], before, after))
+    return entries
+
+def prepare_import(
+    raw: str, catalog_before: list, approvers_before: list, actor: str, actor_id: int,
+) -> Optional[tuple[dict[str, list[tuple]], list[tuple]]]:
+    """Декодирование, валидация и аудит импорта — всё, что не пишет в БД."""
+    data = decode_backup(raw)
+    if data is None:
+        return None
+    return data, diff_backup(data, catalog_before, approvers_before, actor, actor_id)
+
+@traced("db.import")
+def db_apply_backup(data: dict[str, list[tuple]], audit_entries: list[tuple]) -> None:
+    with con:
+        con.executemany(
+            "INSERT OR REPLACE INTO emoji_catalog VALUES (?,?,?,?)",
+            data["emoji_catalog"],
+        )
+        con.executemany(
+            "INSERT OR REPLACE INTO approvers VALUES (?,?,?,?)",
+            data["approvers"],
+        )
+    invalidate_catalog_cache()
+    audit.extend(audit_entries)
+
+async def db_export_async() -> str:
+    """Экспорт в рабочем потоке, чтобы не блокировать event loop."""
+    return await asyncio.to_thread(db_export)
+
+async def db_import_async(raw: str, actor: str, actor_id: int) -> bool:
+    """Декодирование, валидация и сравнение со старыми строками — в рабочем
+    потоке, запись — здесь, одним executemany в транзакции."""
+    # Снимок «до» берём на loop и отдаём потоку. Правка, прошедшая пока
+    # поток считает, в before не попадёт — для аудита импорта это допустимо
+    prepared = await asyncio.to_thread(
+        prepare_import, raw, db_get_catalog(), db_get_approvers(), actor, actor_id,
+    )
+    if prepared is None:
+        return False
+    db_apply_backup(*prepared)
+    return True
+
+# ─────────────────────────────────────────────
+#  Аудит
+# ─────────────────────────────────────────────
+EMOJI_COLUMNS = ("emoji_id", "name", "added_by", "added_at")
+APPROVER_COLUMNS = ("user_id", "username", "added_by", "added_at")
+
+def audit_entry(
+    actor: Optional[str], actor_id: Optional[int], action: str, entity: str,
+    entity_id: Any, before: Optional[Any], after: Optional[Any],
+) -> tuple:
+    """Строка audit_log. Не трогает общее состояние — можно строить в потоке."""
+    return (
+        datetime.utcnow().isoformat(),
+        actor,
+        actor_id,
+        action,
+        entity,
+        None if entity_id is None else str(entity_id),
+        None if before is None else json.dumps(dict(before), ensure_ascii=False),
+        None if after is None else json.dumps(dict(after), ensure_ascii=False),
+    )
+
+class AuditAppender:
+    """Буферизованная запись в audit_log.
+
+    record() только кладёт запись в память — интерактивный путь не платит
+    за лишний commit. Пишем пачками по batch_size; фоновый run() между
+    пачками отдаёт управление loop, так что большой импорт его не морозит.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._buffer: list[tuple] = []
+        self._wakeup = asyncio.Event()
+
+    def record(
+        self, actor: Optional[str], actor_id: Optional[int], action: str, entity: str,
+        entity_id: Any, before: Optional[Any], after: Optional[Any],
+    ) -> None:
+        self.extend([audit_entry(actor, actor_id, action, entity, entity_id, before, after)])
+
+    def extend(self, entries: list[tuple]) -> None:
+        """Готовые строки из audit_entry — например, посчитанные в потоке."""
+        self._buffer.extend(entries)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    @traced("db.audit_flush")
+    def _flush_batch(self) -> int:
+        batch = self._buffer[:self.batch_size]
+        del self._buffer[:len(batch)]
+        with con:
+            con.executemany(
+                "INSERT INTO audit_log "
+                "(ts, actor, actor_id, action, entity, entity_id, before, after) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                batch,
+            )
+        return len(batch)
+
+    def flush(self) -> int:
+        """Всё накопленное сразу — для запросов к аудиту и остановки."""
+        written = 0
+        while self._buffer:
+            written += self._flush_batch()
+        return written
+
+    async def flush_async(self) -> int:
+        """То же пачками, с передачей управления loop между ними.
+        Пишем не больше, чем было в буфере на входе, — иначе под потоком
+        новых записей цикл мог бы не закончиться."""
+        pending, written = len(self._buffer), 0
+        while written < pending and self._buffer:
+            written += self._flush_batch()
+            await asyncio.sleep(0)
+        return written
+
+    async def run(self, interval: float) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush_async()
+            except Exception:
+                log.exception("audit flush failed")
+
+audit = AuditAppender(AUDIT_BATCH)
+
+@traced("db.audit_by_actor")
+def db_audit_by_actor(actor: str, limit: int = 20) -> list:
+    """По username. Username можно сменить — надёжнее db_audit_by_actor_id."""
+    audit.flush()
+    return con.execute(
+        "SELECT * FROM audit_log WHERE actor=? ORDER BY id DESC LIMIT ?",
+        (actor, limit),
+    ).fetchall()
+
+@traced("db.audit_by_actor_id")
+def db_audit_by_actor_id(actor_id: int, limit: int = 20) -> list:
+    audit.flush()
+    return con.execute(
+        "SELECT * FROM audit_log WHERE actor_id=? ORDER BY id DESC LIMIT ?",
+        (actor_id, limit),
+    ).fetchall()
+
+@traced("db.audit_by_entity")
+def db_audit_by_entity(entity: str, entity_id: str, limit: int = 20) -> list:
+    audit.flush()
+    return con.execute(
+        "SELECT * FROM audit_log WHERE entity=? AND entity_id=? ORDER BY id DESC LIMIT ?",
+        (entity, entity_id, limit),
+    ).fetchall()
+
+# ─────────────────────────────────────────────
+#  Автобэкапы
+# ─────────────────────────────────────────────
+# Файлы: full-<seq>.json.gz — полный снимок, delta-<seq>.json.gz — строки,
+# изменённые после предыдущего снимка. seq — последняя запись change_log,
+# вошедшая в файл. Восстановление: последний full + все delta после него.
+# Таблица → столбцы первичного ключа. Составной ключ хранится в change_log
+# и в списках удалённых как JSON-массив, одиночный — как есть
+BACKUP_KEYS: dict[str, tuple[str, ...]] = {
+    "emoji_catalog":        ("emoji_id",),
+    "approvers":            ("user_id",),
+    "users":                ("bot_id", "user_id"),
+    "broadcasts":           ("id",),
+    "broadcast_recipients": ("broadcast_id", "bot_id", "chat_id"),
+    "audit_log":            ("id",),
+}
+# Таблицы только на добавление: при восстановлении их не чистим
+# и не перезаписываем (триггеры audit_log запрещают UPDATE/DELETE)
+BACKUP_APPEND_ONLY = {"audit_log"}
+
+def _change_key_sql(ref: str, key: tuple[str, ...]) -> str:
+    if len(key) == 1:
+        return f"{ref}.{key[0]}"
+    return "json_array(" + ", ".join(f"{ref}.{col}" for col in key) + ")"
+
+def _key_values(key: tuple[str, ...], raw: Any) -> tuple:
+    """Значение из change_log / списка удалённых → параметры для WHERE."""
+    if len(key) == 1:
+        return (raw,)
+    return tuple(json.loads(raw) if isinstance(raw, str) else raw)
+
+def _key_where(key: tuple[str, ...]) -> str:
+    return " AND ".join(f"{col}=?" for col in key)
+
+backup_state = {"last_seq": 0, "deltas_since_full": 0, "has_full": False}
+# asyncio-лок — чтобы снимки не стартовали с одного и того же last_seq;
+# потоковый — на случай, когда отменённый run_backup оставил поток дописывать файл
+backup_lock = asyncio.Lock()
+_snapshot_thread_lock = threading.Lock()
+
+def _backup_files(kind: str) -> list[tuple[int, str]]:
+    """[(seq, path)] файлов заданного вида, по возрастанию seq."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    result = []
+    for fname in os.listdir(BACKUP_DIR):
+        if fname.startswith(f"{kind}-") and fname.endswith(".json.gz"):
+            seq = int(fname[len(kind) + 1:-len(".json.gz")])
+            result.append((seq, os.path.join(BACKUP_DIR, fname)))
+    return sorted(result)
+
+def _collect_snapshot(full: bool, since_seq: int) -> tuple[int, dict]:
+    """Читаем из БД полный снимок или дельту после since_seq."""
+    # sqlite_sequence, а не MAX(seq): после полного снимка change_log чистится,
+    # а номер должен только расти
+    row = con.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()
+    seq = row["seq"] if row else 0
+    data: dict[str, Any] = {"seq": seq, "full": full, "deleted": {}}
+    for table, key in BACKUP_KEYS.items():
+        if full:
+            rows = con.execute(f"SELECT * FROM {table}").fetchall()
+            data[table] = [dict(r) for r in rows]
+            continue
+        keys = [
+            r["key"] for r in con.execute(
+                "SELECT DISTINCT key FROM change_log WHERE tbl=? AND seq>? AND seq<=?",
+                (table, since_seq, seq),
+            )
+        ]
+        changed, deleted = [], []
+        for k in keys:
+            values = _key_values(key, k)
+            row = con.execute(f"SELECT * FROM {table} WHERE {_key_where(key)}", values).fetchone()
+            if row is None:
+                deleted.append(values[0] if len(key) == 1 else list(values))
+            else:
+                changed.append(dict(row))
+        data[table] = changed
+        data["deleted"][table] = deleted
+    return seq, data
+
+def _write_snapshot(seq: int, data: dict) -> str:
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    kind = "full" if data["full"] else "delta"
+    path = os.path.join(BACKUP_DIR, f"{kind}-{seq:012d}.json.gz")
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+    return path
+
+def _apply_retention() -> None:
+    """Оставляем BACKUP_KEEP_FULL последних полных снимков и их дельты."""
+    fulls = _backup_files("full")
+    if len(fulls) <= BACKUP_KEEP_FULL:
+        return
+    oldest_kept = fulls[-BACKUP_KEEP_FULL][0]
+    for seq, path in fulls[:-BACKUP_KEEP_FULL] + _backup_files("delta"):
+        if seq < oldest_kept:
+            os.remove(path)
+
+def _take_snapshot(full: bool, since_seq: int) -> Optional[tuple[int, str]]:
+    with _snapshot_thread_lock:
+        seq, data = _collect_snapshot(full, since_seq)
+        if not full and seq == since_seq:
+            return None
+        path = _write_snapshot(seq, data)
+        if full:
+            _apply_retention()
+        return seq, path
+
+async def run_backup(force_full: bool = False, compact: bool = True) -> Optional[str]:
+    """Снимок в рабочем потоке: дельта или, раз в BACKUP_FULL_EVERY, полный.
+
+    compact=False — внеплановая дельта (например, после пачки рассылки):
+    она не приближает полный снимок, чтобы частые дельты не вызывали
+    частые полные дампы.
+    """
+    async with backup_lock:
+        full = (
+            force_full
+            or not backup_state["has_full"]
+            or (compact and backup_state["deltas_since_full"] >= BACKUP_FULL_EVERY)
+        )
+        result = await asyncio.to_thread(_take_snapshot, full, backup_state["last_seq"])
+        if result is None:
+            return None
+        seq, path = result
+        backup_state["last_seq"] = seq
+        if full:
+            backup_state["has_full"] = True
+            backup_state["deltas_since_full"] = 0
+            # Всё до полного снимка больше не нужно
+            con.execute("DELETE FROM change_log WHERE seq<=?", (seq,))
+            con.commit()
+        elif compact:
+            backup_state["deltas_since_full"] += 1
+    log.log(logging.INFO if compact else logging.DEBUG, "backup written: %s", path)
+    return path
+
+def _load_backup_chain() -> Optional[tuple[dict, list[dict]]]:
+    fulls = _backup_files("full")
+    if not fulls:
+        return None
+    base_seq, base_path = fulls[-1]
+    with gzip.open(base_path, "rt", encoding="utf-8") as f:
+        base = json.load(f)
+    deltas = []
+    for seq, path in _backup_files("delta"):
+        if seq > base_seq:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                deltas.append(json.load(f))
+    return base, deltas
+
+async def restore_backups() -> bool:
+    """Поднимаем БД из base + дельт. Файлы читаются в рабочем потоке,
+    запись — одной транзакцией."""
+    chain = await asyncio.to_thread(_load_backup_chain)
+    if chain is None:
         return False
+    base, deltas = chain
+    with con:
+        for table in BACKUP_KEYS:
+            if table not in BACKUP_APPEND_ONLY:
+                con.execute(f"DELETE FROM {table}")
+        for snap in [base] + deltas:
+            for table, key in BACKUP_KEYS.items():
+                # Снимки старых версий могут не содержать новых таблиц
+                conflict = "IGNORE" if table in BACKUP_APPEND_ONLY else "REPLACE"
+                for r in snap.get(table, []):
+                    cols = ", ".join(r)
+                    marks = ", ".join("?" for _ in r)
+                    con.execute(
+                        f"INSERT OR {conflict} INTO {table} ({cols}) VALUES ({marks})",
+                        tuple(r.values()),
+                    )
+                con.executemany(
+                    f"DELETE FROM {table} WHERE {_key_where(key)}",
+                    [_key_values(key, k) for k in snap["deleted"].get(table, [])],
+                )
+        # Восстановленное уже лежит в файлах; нумерация продолжается с последнего seq
+        last_seq = (deltas[-1] if deltas else base)["seq"]
+        con.execute("DELETE FROM change_log")
+        con.execute("DELETE FROM sqlite_sequence WHERE name='change_log'")
+        con.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)",
+            (last_seq,),
+        )
+    invalidate_catalog_cache()
+    known_users.update(
+        (r["bot_id"], r["user_id"]) for r in con.execute("SELECT bot_id, user_id FROM users")
+    )
+    audit.record("system", None, "restore", "backup", last_seq, None, {"deltas": len(deltas)})
+    backup_state.update(last_seq=last_seq, deltas_since_full=len(deltas), has_full=True)
+    log.info("restored backup seq=%s (%s deltas)", last_seq, len(deltas))
+    return True
+
+async def backup_scheduler() -> None:
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            await run_backup()
+        except Exception:
+            log.exception("scheduled backup failed")
 
 # ─────────────────────────────────────────────
 #  Сессии
@@ -150,19 +876,22 @@ class Session:
         self.photo_file_id: Optional[str] = None
         self.waiting_for_photo: bool = False
 
-sessions: dict[int, Session] = {}
+# Ключ — (bot_id, user_id): у каждого бота свои сессии
+sessions: dict[tuple[int, int], Session] = {}
 
-def get_session(user_id: int) -> Session:
-    if user_id not in sessions:
-        sessions[user_id] = Session()
-    return sessions[user_id]
+def get_session(bot_id: int, user_id: int) -> Session:
+    key = (bot_id, user_id)
+    if key not in sessions:
+        sessions[key] = Session()
+    return sessions[key]
 
 # ─────────────────────────────────────────────
 #  Глобальные состояния admin
 # ─────────────────────────────────────────────
-admin_waiting_add:    set[int] = set()
-admin_waiting_remove: set[int] = set()
-admin_waiting_down:   set[int] = set()
+# Элементы — (bot_id, user_id), как у сессий
+admin_waiting_add:    set[tuple[int, int]] = set()
+admin_waiting_remove: set[tuple[int, int]] = set()
+admin_waiting_down:   set[tuple[int, int]] = set()
 
 # ─────────────────────────────────────────────
 #  Helpers
@@ -176,6 +905,7 @@ def is_admin(username: Optional[str]) -> bool:
 def tg_emoji_tag(emoji_id: str, placeholder: str = "⭐") -> str:
     return f'<tg-emoji emoji-id="{emoji_id}">{placeholder}</tg-emoji>'
 
+@traced("render.final_text")
 def build_final_text(session: Session) -> str:
     chunks: list[str] = []
     for part in session.parts:
@@ -199,6 +929,7 @@ def extract_custom_emoji_ids(message: Message) -> list[str]:
 # ─────────────────────────────────────────────
 #  Клавиатуры
 # ─────────────────────────────────────────────
+@traced("render.editor_keyboard")
 def build_editor_keyboard(session: Session) -> InlineKeyboardMarkup:
     rows: list[list[InlineKeyboardButton]] = []
     for i, part in enumerate(session.parts):
@@ -240,6 +971,7 @@ def build_editor_keyboard(session: Session) -> InlineKeyboardMarkup:
         ])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@traced("render.picker_keyboard")
 def build_picker_keyboard(page: int) -> InlineKeyboardMarkup:
     catalog = db_get_catalog()
     total = len(catalog)
@@ -286,6 +1018,7 @@ def build_picker_keyboard(page: int) -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text="❌ Закрыть", callback_data="ep_close")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+@traced("render.picker_text")
 def build_picker_text(page: int) -> str:
     catalog = db_get_catalog()
     per_page = 10
@@ -300,6 +1033,7 @@ def build_picker_text(page: int) -> str:
         lines.append(f"{num}. {preview} {row['name']}")
     return "\n".join(lines)
 
+@traced("render.upuser_text")
 def build_upuser_text() -> str:
     approvers = db_get_approvers()
     lines = ["👑 <b>Панель администратора</b>\n", "<b>Аппруверы:</b>"]
@@ -311,12 +1045,14 @@ def build_upuser_text() -> str:
         lines.append("• Список пуст")
     return "\n".join(lines)
 
+@traced("render.upuser_keyboard")
 def build_upuser_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="➕ Добавить аппрувера", callback_data="adm_add")],
         [InlineKeyboardButton(text="➖ Удалить аппрувера",  callback_data="adm_remove")],
     ])
 
+@traced("render.approver_emoji_keyboard")
 def build_approver_emoji_keyboard(emoji_ids: list[str]) -> InlineKeyboardMarkup:
     """Клавиатура для аппрувера — список найденных эмодзи с кнопками добавления."""
     rows: list[list[InlineKeyboardButton]] = []
@@ -330,16 +1066,372 @@ def build_approver_emoji_keyboard(emoji_ids: list[str]) -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton(text="❌ Закрыть", callback_data="aq_close")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+# ─────────────────────────────────────────────
+#  Admission control
+# ─────────────────────────────────────────────
+# Приоритеты: чем меньше число, тем раньше апдейт получит слот
+PRIO_ADMIN    = 0
+PRIO_CALLBACK = 1
+PRIO_MESSAGE  = 2
+
+BUSY_TEXT = "⏳ Бот перегружен, попробуй ещё раз через минуту."
+
+class AdmissionController:
+    """Ограничивает число одновременно работающих хендлеров.
+
+    Апдейты сверх лимита ждут в очереди с приоритетами. Когда очередь
+    заполнена, вытесняется наименее ценный апдейт — либо ожидающий,
+    либо сам новый.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.stats = {
+            "admitted": 0,
+            "queued":   0,
+            "shed":     0,
+            "max_wait": 0.0,
+        }
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int) -> bool:
+        """Ждём свободный слот. False — апдейт сброшен, обрабатывать нельзя."""
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return True
+
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                self.stats["shed"] += 1
+                return False
+            # Новый апдейт ценнее худшего ожидающего — вытесняем его
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            if not worst[2].done():
+                worst[2].set_result(False)
+                self.stats["shed"] += 1
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        self.stats["queued"] += 1
+        started = time.monotonic()
+        try:
+            admitted = await fut
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            elif fut.done() and not fut.cancelled() and fut.result():
+                # Слот уже передан нам — возвращаем его
+                self.release()
+            raise
+        waited = time.monotonic() - started
+        self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        if admitted:
+            self.stats["admitted"] += 1
+        return admitted
+
+    def release(self) -> None:
+        """Освобождаем слот: передаём его самому приоритетному ожидающему."""
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.in_flight -= 1
+
+admission = AdmissionController(MAX_IN_FLIGHT, MAX_QUEUE)
+
+def update_user(update: Update) -> Optional[User]:
+    if update.callback_query:
+        return update.callback_query.from_user
+    if update.message:
+        return update.message.from_user
+    return None
+
+def update_priority(update: Update) -> int:
+    if update.callback_query:
+        prio = PRIO_CALLBACK
+    elif update.message:
+        text = update.message.text or ""
+        # Команды — это навигация, а не новая работа для редактора
+        prio = PRIO_CALLBACK if text.startswith("/") else PRIO_MESSAGE
+    else:
+        return PRIO_MESSAGE
+    user = update_user(update)
+    if user and is_admin(user.username):
+        return PRIO_ADMIN
+    return prio
+
+async def _reply_busy(update: Update) -> None:
+    """Дешёвый ответ на сброшенный апдейт: без БД и без рендера."""
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(BUSY_TEXT)
+        elif update.message:
+            await update.message.answer(BUSY_TEXT)
+    except Exception as e:
+        log.warning("busy reply failed: %s", e)
+
+class AdmissionMiddleware(BaseMiddleware):
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        with span("admission.wait"):
+            admitted = await self.controller.acquire(update_priority(event))
+        if not admitted:
+            await _reply_busy(event)
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            self.controller.release()
+
+class KnownUsersMiddleware(BaseMiddleware):
+    """Запоминаем всех, кто писал боту — это аудитория рассылок."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        user = update_user(event)
+        if user is not None:
+            db_remember_user(data["bot"].id, user.id)
+        return await handler(event, data)
+
+# Поля с персональными данными, которые встречаются не только в User/Chat
+_ANON_NAME_KEYS = {"username", "first_name", "last_name", "sender_user_name", "author_signature"}
+_ANON_SECRET_KEYS = {"phone_number", "vcard"}
+
+def _is_user_or_chat(obj: dict) -> bool:
+    """User и Chat узнаём по форме: целый id плюс is_bot (User) или type (Chat)."""
+    return isinstance(obj.get("id"), int) and ("is_bot" in obj or "type" in obj)
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Пишет сырые апдейты в JSONL: {"ts", "bot_id", "update"}.
+    id заменяются на HMAC с солью, которая живёт только в этом процессе,
+    имена — на псевдонимы (кроме админов, чтобы replay проходил их ветки).
+    Обходится всё дерево апдейта: User/Chat в списках (new_chat_members),
+    left_chat_member, contact, forward_origin и т.п."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8", buffering=1)
+        self.salt = os.urandom(16)
+
+    def _anon_id(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+        anon = int.from_bytes(digest[:5], "big")
+        # Знак сохраняем: отрицательные id — группы и каналы
+        return -anon if value < 0 else anon
+
+    def _anonymize(self, obj: Any) -> Any:
+        if isinstance(obj, list):
+            return [self._anonymize(v) for v in obj]
+        if not isinstance(obj, dict):
+            return obj
+        identity = _is_user_or_chat(obj)
+        if identity:
+            alias = f"anon{self._anon_id(obj['id'])}"
+        elif isinstance(obj.get("user_id"), int):
+            alias = f"anon{self._anon_id(obj['user_id'])}"
+        else:
+            alias = "anon"
+        result = {}
+        for key, value in obj.items():
+            if key == "id" and identity:
+                value = self._anon_id(value)
+            elif key == "user_id" and isinstance(value, int):
+                value = self._anon_id(value)
+            elif key in _ANON_NAME_KEYS or (key == "title" and identity):
+                if isinstance(value, str) and not (key == "username" and is_admin(value)):
+                    value = alias
+            elif key in _ANON_SECRET_KEYS:
+                value = "anon"
+            else:
+                value = self._anonymize(value)
+            result[key] = value
+        return result
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            raw = event.model_dump(mode="json", exclude_none=True, by_alias=True)
+            record = {"ts": time.time(), "bot_id": data["bot"].id, "update": self._anonymize(raw)}
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            log.warning("update recording failed: %s", e)
+        return await handler(event, data)
+
+def update_span_name(update: Update) -> str:
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        return f"update.callback[{data}]"
+    if update.message:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            return f"update.command[{text.split()[0]}]"
+        return "update.message"
+    return f"update.{update.event_type}"
+
+class TracingMiddleware(BaseMiddleware):
+    """Корневой спан на каждый апдейт + лог медленных апдейтов."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        root = Span(update_span_name(event))
+        token = current_span.set(root)
+        try:
+            return await handler(event, data)
+        finally:
+            root.end = time.perf_counter()
+            current_span.reset(token)
+            if root.duration_ms > SLOW_UPDATE_MS:
+                log.warning("slow update %s:\n%s", event.update_id, root.format_tree())
+
+class ApiTracingMiddleware(BaseRequestMiddleware):
+    """Спан на каждый запрос к Bot API."""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        with span(f"api.{type(method).__name__}"):
+            return await make_request(bot, method)
+
+profiling = False
+
+async def run_profile(seconds: int) -> str:
+    """Снимаем cProfile со всего event loop'а на заданное время."""
+    global profiling
+    profiling = True
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        profiling = False
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+    return out.getvalue()
+
+def build_stats_text() -> str:
+    st = admission.stats
+    lines = [
+        "📊 <b>Нагрузка</b>\n",
+        f"В работе: {admission.in_flight}/{admission.max_in_flight}",
+        f"В очереди: {admission.queue_size}/{admission.max_queue}",
+        f"Принято: {st['admitted']}",
+        f"Ждали в очереди: {st['queued']}",
+        f"Сброшено: {st['shed']}",
+        f"Макс. ожидание: {st['max_wait']:.2f} с",
+    ]
+    ps = api_session.pool_stats()
+    lines += [
+        "\n🌐 <b>Bot API</b>\n",
+        f"Запросов: {ps['requests']}",
+        f"В полёте: {ps['in_flight']} (макс. {ps['max_in_flight']})",
+        f"Соединения: занято {ps['conn_acquired']}/{API_POOL_LIMIT_PER_HOST}, "
+        f"простаивает {ps['conn_idle']}, ждут {ps['conn_waiting']}",
+    ]
+    return "\n".join(lines)
+
+# ─────────────────────────────────────────────
+#  Bot API клиент
+# ─────────────────────────────────────────────
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession с настроенным пулом соединений и счётчиками запросов."""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._connector_init.update(
+            limit=API_POOL_LIMIT,
+            limit_per_host=API_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=API_KEEPALIVE,
+            use_dns_cache=True,
+            ttl_dns_cache=API_DNS_TTL,
+        )
+        self.requests_total = 0
+        self.requests_in_flight = 0
+        self.requests_max_in_flight = 0
+
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None):
+        self.requests_total += 1
+        self.requests_in_flight += 1
+        self.requests_max_in_flight = max(self.requests_max_in_flight, self.requests_in_flight)
+        try:
+            return await super().make_request(bot, method, timeout=timeout)
+        finally:
+            self.requests_in_flight -= 1
+
+    def pool_stats(self) -> dict[str, int]:
+        stats = {
+            "requests":        self.requests_total,
+            "in_flight":       self.requests_in_flight,
+            "max_in_flight":   self.requests_max_in_flight,
+            "conn_acquired":   0,
+            "conn_idle":       0,
+            "conn_waiting":    0,
+        }
+        connector = self._session.connector if self._session and not self._session.closed else None
+        if connector is not None:
+            # Внутренние поля aiohttp — только для статистики
+            stats["conn_acquired"] = len(getattr(connector, "_acquired", ()))
+            stats["conn_idle"] = sum(len(c) for c in getattr(connector, "_conns", {}).values())
+            stats["conn_waiting"] = sum(len(w) for w in getattr(connector, "_waiters", {}).values())
+        return stats
+
+def create_api_session() -> TunedAiohttpSession:
+    api = (
+        TelegramAPIServer.from_base(BOT_API_BASE, is_local=True)
+        if BOT_API_BASE else PRODUCTION
+    )
+    return TunedAiohttpSession(api=api, timeout=API_TIMEOUT)
+
+api_session = create_api_session()
+
 # ─────────────────────────────────────────────
 #  Bot + Dispatcher
 # ─────────────────────────────────────────────
-bot = Bot(token=TOKEN)
+# Все боты делят одну HTTP-сессию, БД и каталог; один dp поллит их всех
+bots = [Bot(token=token, session=api_session) for token in TOKENS]
+bots_by_id = {b.id: b for b in bots}
+main_bot = bots[0]
 dp  = Dispatcher()
+api_session.middleware(ApiTracingMiddleware())
+if RECORD_UPDATES_PATH:
+    dp.update.outer_middleware(UpdateRecorderMiddleware(RECORD_UPDATES_PATH))
+dp.update.outer_middleware(TracingMiddleware())
+dp.update.outer_middleware(AdmissionMiddleware(admission))
+dp.update.outer_middleware(KnownUsersMiddleware())
 
 # ─────────────────────────────────────────────
 #  Вспомогательные функции
 # ─────────────────────────────────────────────
-async def _refresh_editor(chat_id: int, session: Session) -> None:
+async def _refresh_editor(bot: Bot, chat_id: int, session: Session) -> None:
     """Обновляем сообщение редактора."""
     text   = build_final_text(session)
     markup = build_editor_keyboard(session)
@@ -384,10 +1476,10 @@ async def _refresh_editor(chat_id: int, session: Session) -> None:
     session.last_message_id = sent.message_id
 
 
-async def _handle_emoji_scan(message: Message, emoji_ids: list[str]) -> None:
+async def _handle_emoji_scan(bot: Bot, message: Message, emoji_ids: list[str]) -> None:
     """Обработка найденных эмодзи — для аппрувера и обычного пользователя."""
     uid = message.from_user.id
-    session = get_session(uid)
+    session = get_session(bot.id, uid)
     username = message.from_user.username or str(uid)
 
     if not emoji_ids:
@@ -416,6 +1508,105 @@ async def _handle_emoji_scan(message: Message, emoji_ids: list[str]) -> None:
         await message.answer("\n".join(lines), parse_mode="HTML")
 
 
+# ─────────────────────────────────────────────
+#  Рассылки
+# ─────────────────────────────────────────────
+BROADCAST_TARGETS = {"approvers": "аппруверам", "users": "всем пользователям"}
+
+broadcast_wakeup = asyncio.Event()
+
+def broadcast_recipients(target: str, bot_id: int) -> list[tuple[int, int]]:
+    if target == "approvers":
+        return db_get_approver_recipients(bot_id)
+    return db_get_user_recipients()
+
+async def _wait_for_idle_slot() -> None:
+    """Рассылка уступает интерактивному трафику: ждём, пока схлынет нагрузка."""
+    while admission.queue_size or admission.in_flight >= BROADCAST_YIELD_IN_FLIGHT:
+        await asyncio.sleep(0.5)
+
+async def _deliver(bot_id: int, chat_id: int, text: str) -> tuple[str, Optional[str]]:
+    """Одно сообщение с учётом retry_after. Возвращает (статус, ошибка)."""
+    bot = bots_by_id.get(bot_id)
+    if bot is None:
+        return "failed", f"bot {bot_id} is not configured"
+    while True:
+        try:
+            await bot.send_message(chat_id, text, parse_mode="HTML")
+            return "sent", None
+        except TelegramRetryAfter as e:
+            log.warning("broadcast flood control: sleeping %s s", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except TelegramForbiddenError as e:
+            return "blocked", e.message
+        except TelegramAPIError as e:
+            return "failed", e.message
+
+def build_broadcast_text(row: sqlite3.Row) -> str:
+    progress = db_broadcast_progress(row["id"])
+    pending = progress.get("pending", 0)
+    done = sum(progress.values()) - pending
+    eta = pending / BROADCAST_RATE
+    return (
+        f"📣 <b>Рассылка #{row['id']}</b> ({BROADCAST_TARGETS[row['target']]}) — {row['status']}\n"
+        f"Отправлено: {progress.get('sent', 0)}, "
+        f"заблокировали: {progress.get('blocked', 0)}, "
+        f"ошибки: {progress.get('failed', 0)}\n"
+        f"Прогресс: {done}/{done + pending}, ETA ≈ {eta:.0f} с"
+    )
+
+async def _broadcast_step(interval: float) -> None:
+    """Одна итерация воркера: ждём рассылку, закрываем её или шлём пачку."""
+    row = db_next_broadcast()
+    if row is None:
+        broadcast_wakeup.clear()
+        await broadcast_wakeup.wait()
+        return
+    recipients = db_pending_recipients(row["id"], BROADCAST_BATCH)
+    if not recipients:
+        db_set_broadcast_status(row["id"], "done")
+        log.info("broadcast %s done", row["id"])
+        try:
+            await bots_by_id.get(row["bot_id"], main_bot).send_message(
+                row["created_by"], build_broadcast_text(db_get_broadcast(row["id"])),
+                parse_mode="HTML",
+            )
+        except TelegramAPIError as e:
+            log.warning("broadcast report failed: %s", e)
+        return
+    results = []
+    try:
+        for bot_id, chat_id in recipients:
+            # Рассылку могли отменить посреди пачки
+            if db_get_broadcast(row["id"])["status"] != "running":
+                break
+            await _wait_for_idle_slot()
+            started = time.monotonic()
+            status, error = await _deliver(bot_id, chat_id, row["text"])
+            results.append((bot_id, chat_id, status, error))
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        # Даже при сбое посреди пачки фиксируем тех, кому уже отправили
+        if results:
+            db_mark_recipients(row["id"], results)
+            # БД в памяти: без снимка после пачки сбой вернул бы в pending
+            # всех, кому отправили с последнего планового бэкапа
+            await run_backup(compact=False)
+
+async def broadcast_worker() -> None:
+    """Единственный воркер рассылок: темп BROADCAST_RATE, статусы в БД.
+    Незавершённые получатели остаются 'pending', поэтому после сбоя
+    или перезапуска воркер продолжает с того же места."""
+    interval = 1 / BROADCAST_RATE
+    while True:
+        try:
+            await _broadcast_step(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("broadcast worker failed, retrying")
+            await asyncio.sleep(BROADCAST_ERROR_BACKOFF)
+
 # ─────────────────────────────────────────────
 #  Команды
 # ─────────────────────────────────────────────
@@ -451,43 +1642,189 @@ async def cmd_up(message: Message) -> None:
     if not is_admin(message.from_user.username):
         await message.answer("⛔ Нет доступа.")
         return
-    backup = db_export()
+    backup = await db_export_async()
     await message.answer(f"📦 <b>Бэкап:</b>\n<code>{backup}</code>", parse_mode="HTML")
 
 @dp.message(Command("down"))
-async def cmd_down(message: Message) -> None:
+async def cmd_down(message: Message, bot: Bot) -> None:
     if not is_admin(message.from_user.username):
         await message.answer("⛔ Нет доступа.")
         return
-    admin_waiting_down.add(message.from_user.id)
+    admin_waiting_down.add((bot.id, message.from_user.id))
     await message.answer(
         "📥 Отправь строку бэкапа (начинается с <code>EMOJI_BACKUP:</code>):",
         parse_mode="HTML",
     )
 
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message) -> None:
+    if not is_admin(message.from_user.username):
+        await message.answer("⛔ Нет доступа.")
+        return
+    await message.answer(build_stats_text(), parse_mode="HTML")
+
+@dp.message(Command("profile"))
+async def cmd_profile(message: Message) -> None:
+    if not is_admin(message.from_user.username):
+        await message.answer("⛔ Нет доступа.")
+        return
+    if profiling:
+        await message.answer("⏳ Профилирование уже идёт.")
+        return
+    args = (message.text or "").split()
+    try:
+        seconds = int(args[1]) if len(args) > 1 else 10
+    except ValueError:
+        await message.answer("❌ Использование: <code>/profile 10</code>", parse_mode="HTML")
+        return
+    seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+    await message.answer(f"🔬 Профилирую {seconds} с…")
+    report = await run_profile(seconds)
+    await message.answer_document(
+        BufferedInputFile(report.encode(), filename="profile.txt"),
+        caption=f"🔬 cProfile за {seconds} с",
+    )
+
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, bot: Bot) -> None:
+    if not is_admin(message.from_user.username):
+        await message.answer("⛔ Нет доступа.")
+        return
+    args = message.html_text.split(maxsplit=2)
+    if len(args) < 3 or args[1] not in BROADCAST_TARGETS:
+        await message.answer(
+            "📣 Использование:\n"
+            "<code>/broadcast approvers текст</code> — аппруверам\n"
+            "<code>/broadcast users текст</code> — всем пользователям",
+            parse_mode="HTML",
+        )
+        return
+    target, text = args[1], args[2]
+    recipients = broadcast_recipients(target, bot.id)
+    if not recipients:
+        await message.answer("❌ Получателей нет.")
+        return
+    broadcast_id = db_create_broadcast(text, target, bot.id, message.from_user.id, recipients)
+    broadcast_wakeup.set()
+    await message.answer(
+        build_broadcast_text(db_get_broadcast(broadcast_id))
+        + f"\n\n/bstatus — прогресс, /bcancel {broadcast_id} — отмена",
+        parse_mode="HTML",
+    )
+
+@dp.message(Command("bstatus"))
+async def cmd_bstatus(message: Message) -> None:
+    if not is_admin(message.from_user.username):
+        await message.answer("⛔ Нет доступа.")
+        return
+    rows = db_recent_broadcasts()
+    if not rows:
+        await message.answer("📣 Рассылок ещё не было.")
+        return
+    await message.answer(
+        "\n\n".join(build_broadcast_text(r) for r in rows),
+        parse_mode="HTML",
+    )
+
+@dp.message(Command("bcancel"))
+async def cmd_bcancel(message: Message) -> None:
+    if not is_admin(message.from_user.username):
+        await message.answer("⛔ Нет доступа.")
+        return
+    args = (message.text or "").split()
+    try:
+        broadcast_id = int(args[1])
+    except (ValueError, IndexError):
+        await message.answer("❌ Использование: <code>/bcancel 1</code>", parse_mode="HTML")
+        return
+    if db_set_broadcast_status(broadcast_id, "cancelled"):
+        await message.answer(f"🛑 Рассылка #{broadcast_id} отменена.")
+    else:
+        await message.answer(f"❌ Активной рассылки #{broadcast_id} нет.")
+
+AUDIT_ENTITIES = ("emoji", "approver")
+
+def build_audit_text(title: str, rows: list) -> str:
+    lines = [f"🧾 <b>{title}</b>\n"]
+    if not rows:
+        lines.append("Записей нет.")
+    for r in rows:
+        change = ""
+        if r["before"] and r["after"]:
+            change = f"\n   было: <code>{html.escape(r['before'], quote=False)}</code>"
+        if r["after"]:
+            change += f"\n   стало: <code>{html.escape(r['after'], quote=False)}</code>"
+        elif r["before"]:
+            change += f"\n   было: <code>{html.escape(r['before'], quote=False)}</code>"
+        actor = html.escape(r["actor"] or "—")
+        if r["actor_id"] is not None:
+            actor += f" ({r['actor_id']})"
+        lines.append(
+            f"• {r['ts'][:19]} {actor}: "
+            f"{r['action']} {r['entity']} <code>{html.escape(r['entity_id'] or '')}</code>{change}"
+        )
+    return "\n".join(lines)
+
+@dp.message(Command("audit"))
+async def cmd_audit(message: Message) -> None:
+    if not is_admin(message.from_user.username):
+        await message.answer("⛔ Нет доступа.")
+        return
+    args = (message.text or "").split()
+    if len(args) < 3 or args[1] not in ("user", *AUDIT_ENTITIES):
+        await message.answer(
+            "🧾 Использование:\n"
+            "<code>/audit user user_id</code> — изменения пользователя\n"
+            "<code>/audit user username</code> — то же по текущему username\n"
+            "<code>/audit emoji emoji_id</code> — история эмодзи\n"
+            "<code>/audit approver user_id</code> — история аппрувера",
+            parse_mode="HTML",
+        )
+        return
+    kind, value = args[1], args[2].lstrip("@")
+    # Хвост буфера после большого импорта дописываем пачками, не морозя loop
+    await audit.flush_async()
+    if kind == "user" and value.isdigit():
+        rows = db_audit_by_actor_id(int(value))
+        title = f"Изменения пользователя {value}"
+    elif kind == "user":
+        rows = db_audit_by_actor(value)
+        title = f"Изменения @{html.escape(value)}"
+    else:
+        rows = db_audit_by_entity(kind, value)
+        title = f"История {kind} {html.escape(value)}"
+    text = build_audit_text(title, rows)
+    if len(text) > 4000:
+        await message.answer_document(
+            BufferedInputFile(text.encode(), filename="audit.txt"),
+            caption=f"🧾 {title}",
+        )
+        return
+    await message.answer(text, parse_mode="HTML")
+
 @dp.message(Command("cancel"))
-async def cmd_cancel(message: Message) -> None:
+async def cmd_cancel(message: Message, bot: Bot) -> None:
     uid = message.from_user.id
-    admin_waiting_add.discard(uid)
-    admin_waiting_remove.discard(uid)
-    admin_waiting_down.discard(uid)
-    session = get_session(uid)
+    admin_waiting_add.discard((bot.id, uid))
+    admin_waiting_remove.discard((bot.id, uid))
+    admin_waiting_down.discard((bot.id, uid))
+    session = get_session(bot.id, uid)
     session.waiting_for_input = False
     session.waiting_for_photo = False
     session.waiting_for_emoji_name = False
     session.pending_emoji_id = None
     session.pending_emoji_queue = []
     if session.parts:
-        await _refresh_editor(message.chat.id, session)
+        await _refresh_editor(bot, message.chat.id, session)
     await message.answer("❌ Отменено.")
 
 # ─────────────────────────────────────────────
 #  Хендлер: фото
 # ─────────────────────────────────────────────
 @dp.message(F.photo)
-async def on_photo(message: Message) -> None:
+async def on_photo(message: Message, bot: Bot) -> None:
     uid = message.from_user.id
-    session = get_session(uid)
+    session = get_session(bot.id, uid)
 
     # Сначала проверяем эмодзи в подписи
     emoji_ids = extract_custom_emoji_ids(message)
@@ -498,20 +1835,20 @@ async def on_photo(message: Message) -> None:
         session.photo_file_id = message.photo[-1].file_id
         # Если в подписи есть эмодзи — тоже обрабатываем
         if emoji_ids:
-            await _handle_emoji_scan(message, emoji_ids)
-        await _refresh_editor(message.chat.id, session)
+            await _handle_emoji_scan(bot, message, emoji_ids)
+        await _refresh_editor(bot, message.chat.id, session)
         return
 
     # Просто фото (не в режиме ожидания) — сканируем эмодзи из подписи
     if emoji_ids:
-        await _handle_emoji_scan(message, emoji_ids)
+        await _handle_emoji_scan(bot, message, emoji_ids)
         return
 
     # Фото без эмодзи — предлагаем прикрепить к редактору если есть активный
     if session.parts:
         session.photo_file_id = message.photo[-1].file_id
         await message.answer("🖼️ Фото прикреплено к текущему редактору!")
-        await _refresh_editor(message.chat.id, session)
+        await _refresh_editor(bot, message.chat.id, session)
     else:
         await message.answer(
             "🖼️ Фото получено, но нет активного редактора.\n"
@@ -524,10 +1861,10 @@ async def on_photo(message: Message) -> None:
 #  (не фото, не текст — документы, видео, etc.)
 # ─────────────────────────────────────────────
 @dp.message(F.forward_origin)
-async def on_forward(message: Message) -> None:
+async def on_forward(message: Message, bot: Bot) -> None:
     emoji_ids = extract_custom_emoji_ids(message)
     if emoji_ids:
-        await _handle_emoji_scan(message, emoji_ids)
+        await _handle_emoji_scan(bot, message, emoji_ids)
     else:
         await message.answer("🔍 Премиум-эмодзи в этом сообщении не найдены.")
 
@@ -540,34 +1877,35 @@ def _has_custom_emoji(message: Message) -> bool:
     return any(e.type == "custom_emoji" for e in message.entities)
 
 @dp.message(F.text, F.func(_has_custom_emoji))
-async def on_premium_emoji(message: Message) -> None:
+async def on_premium_emoji(message: Message, bot: Bot) -> None:
     uid = message.from_user.id
-    session = get_session(uid)
+    session = get_session(bot.id, uid)
 
     # Если ждём текст добавки — добавляем (эмодзи внутри текста — окей)
     if session.waiting_for_input:
         session.parts.append(Part(text=message.text.strip()))
         session.waiting_for_input = False
-        await _refresh_editor(message.chat.id, session)
+        await _refresh_editor(bot, message.chat.id, session)
         return
 
     emoji_ids = extract_custom_emoji_ids(message)
-    await _handle_emoji_scan(message, emoji_ids)
+    await _handle_emoji_scan(bot, message, emoji_ids)
 
 # ─────────────────────────────────────────────
 #  Хендлер: обычный текст
 # ─────────────────────────────────────────────
 @dp.message(F.text)
-async def on_text(message: Message) -> None:
+async def on_text(message: Message, bot: Bot) -> None:
     uid      = message.from_user.id
     text     = message.text.strip()
-    username = message.from_user.username or ""
-    session  = get_session(uid)
+    # Одинаковый fallback для added_by/аудита на всех путях: username или id
+    username = message.from_user.username or str(uid)
+    session  = get_session(bot.id, uid)
 
     # 1. Ожидание строки бэкапа
-    if uid in admin_waiting_down:
-        admin_waiting_down.discard(uid)
-        if db_import(text):
+    if (bot.id, uid) in admin_waiting_down:
+        admin_waiting_down.discard((bot.id, uid))
+        if await db_import_async(text, username, uid):
             await message.answer("✅ Бэкап восстановлен!")
         else:
             await message.answer(
@@ -577,7 +1915,7 @@ async def on_text(message: Message) -> None:
         return
 
     # 2. Ожидание добавления аппрувера
-    if uid in admin_waiting_add:
+    if (bot.id, uid) in admin_waiting_add:
         parts_input = text.strip().split()
         try:
             target_id = int(parts_input[0])
@@ -592,8 +1930,8 @@ async def on_text(message: Message) -> None:
             )
             return
         target_username = parts_input[1].lstrip("@") if len(parts_input) > 1 else ""
-        admin_waiting_add.discard(uid)
-        db_add_approver(target_id, target_username, username or str(uid))
+        admin_waiting_add.discard((bot.id, uid))
+        db_add_approver(target_id, target_username, username, uid)
         uname_display = f"@{target_username}" if target_username else "без username"
         await message.answer(
             f"✅ Аппрувер добавлен!\n"
@@ -609,7 +1947,7 @@ async def on_text(message: Message) -> None:
         return
 
     # 3. Ожидание ID для удаления
-    if uid in admin_waiting_remove:
+    if (bot.id, uid) in admin_waiting_remove:
         try:
             target_id = int(text.strip())
         except ValueError:
@@ -619,8 +1957,8 @@ async def on_text(message: Message) -> None:
                 parse_mode="HTML",
             )
             return
-        admin_waiting_remove.discard(uid)
-        if db_remove_approver(target_id):
+        admin_waiting_remove.discard((bot.id, uid))
+        if db_remove_approver(target_id, username, uid):
             await message.answer(
                 f"✅ Аппрувер <code>{target_id}</code> удалён.",
                 parse_mode="HTML",
@@ -642,7 +1980,7 @@ async def on_text(message: Message) -> None:
         session.waiting_for_emoji_name = False
         emoji_id = session.pending_emoji_id
         session.pending_emoji_id = None
-        db_add_emoji(emoji_id, text, username)
+        db_add_emoji(emoji_id, text, username, uid)
         await message.answer(
             f"✅ Эмодзи {tg_emoji_tag(emoji_id)} <b>{text}</b> добавлен в каталог!",
             parse_mode="HTML",
@@ -653,7 +1991,7 @@ async def on_text(message: Message) -> None:
     if session.waiting_for_input:
         session.parts.append(Part(text=text))
         session.waiting_for_input = False
-        await _refresh_editor(message.chat.id, session)
+        await _refresh_editor(bot, message.chat.id, session)
         return
 
     # 6. Новое сообщение → новый редактор
@@ -676,11 +2014,11 @@ async def on_text(message: Message) -> None:
 #  Callbacks
 # ─────────────────────────────────────────────
 @dp.callback_query()
-async def on_callback(query: CallbackQuery) -> None:
+async def on_callback(query: CallbackQuery, bot: Bot) -> None:
     uid      = query.from_user.id
     data     = query.data
     chat_id  = query.message.chat.id
-    session  = get_session(uid)
+    session  = get_session(bot.id, uid)
     username = query.from_user.username or str(uid)
 
     # ── Админ-панель ─────────────────────────────────────────────────────────
@@ -688,7 +2026,7 @@ async def on_callback(query: CallbackQuery) -> None:
         if not is_admin(query.from_user.username):
             await query.answer("⛔ Нет доступа.")
             return
-        admin_waiting_add.add(uid)
+        admin_waiting_add.add((bot.id, uid))
         await query.answer()
         await query.message.answer(
             "👤 Введи ID аппрувера и username через пробел:\n"
@@ -703,7 +2041,7 @@ async def on_callback(query: CallbackQuery) -> None:
         if not is_admin(query.from_user.username):
             await query.answer("⛔ Нет доступа.")
             return
-        admin_waiting_remove.add(uid)
+        admin_waiting_remove.add((bot.id, uid))
         await query.answer()
         await query.message.answer(
             "🗑 Введи числовой <b>user_id</b> аппрувера для удаления:\n"
@@ -757,7 +2095,7 @@ async def on_callback(query: CallbackQuery) -> None:
         except Exception:
             pass
         session.last_message_id = None
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     # ── Пикер: навигация ─────────────────────────────────────────────────────
@@ -784,7 +2122,7 @@ async def on_callback(query: CallbackQuery) -> None:
         await query.answer("❌ Эмодзи убран")
         await query.message.delete()
         session.picker_message_id = None
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     if data.startswith("ep_sel_"):
@@ -802,7 +2140,7 @@ async def on_callback(query: CallbackQuery) -> None:
             await query.answer("❌ Не найдено")
         await query.message.delete()
         session.picker_message_id = None
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     if data == "ep_close":
@@ -810,7 +2148,7 @@ async def on_callback(query: CallbackQuery) -> None:
         await query.answer("Закрыто")
         await query.message.delete()
         session.picker_message_id = None
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     # ── Редактор ─────────────────────────────────────────────────────────────
@@ -821,13 +2159,13 @@ async def on_callback(query: CallbackQuery) -> None:
             return
         session.waiting_for_input = True
         await query.answer("✏️ Введи текст (или /cancel)")
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     if data == "cancel":
         session.waiting_for_input = False
         await query.answer("❌ Отменено")
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     if data.startswith("toggle_"):
@@ -839,7 +2177,7 @@ async def on_callback(query: CallbackQuery) -> None:
             else:
                 session.parts[idx].emoji_id = NO_EMOJI
                 await query.answer("❌ Эмодзи выключен")
-        await _refresh_editor(chat_id, session)
+        await _refresh_editor(bot, chat_id, session)
         return
 
     if data.startswith("pick_emoji_"):
@@ -864,8 +2202,25 @@ async def on_callback(query: CallbackQuery) -> None:
 # ─────────────────────────────────────────────
 async def main() -> None:
     db_init()
+    await restore_backups()
+    # Рассылки, прерванные перезапуском, продолжаются с pending-получателей
+    for row in db_running_broadcasts():
+        log.info("resuming broadcast %s: %s", row["id"], db_broadcast_progress(row["id"]))
+    broadcast_wakeup.set()
+    scheduler = asyncio.create_task(backup_scheduler())
+    broadcaster = asyncio.create_task(broadcast_worker())
+    auditor = asyncio.create_task(audit.run(AUDIT_FLUSH_INTERVAL))
     log.info("Bot started")
-    await dp.start_polling(bot, skip_updates=True)
+    try:
+        await dp.start_polling(*bots, skip_updates=True, polling_timeout=POLLING_TIMEOUT)
+    finally:
+        scheduler.cancel()
+        broadcaster.cancel()
+        auditor.cancel()
+        # Дожидаемся отмены, чтобы последний снимок не пересёкся с плановым
+        await asyncio.gather(scheduler, broadcaster, auditor, return_exceptions=True)
+        audit.flush()
+        await run_backup()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,195 @@
+"""Replay записанных апдейтов против фейкового Bot API — без сети.
+
+Апдейты пишет UpdateRecorderMiddleware из bot.py (RECORD_UPDATES_PATH).
+Каждый апдейт прогоняется через тот же dp, что и в проде, а запросы
+к Telegram обрабатывает FakeBotAPISession в памяти.
+
+Примеры:
+    python replay.py updates.jsonl                      # исходный темп
+    python replay.py updates.jsonl --speed 10           # в 10 раз быстрее
+    python replay.py updates.jsonl --speed 0 --save run1.json
+    python replay.py updates.jsonl --speed 0 --compare run1.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import time
+import typing
+from collections import Counter
+from datetime import datetime
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+import bot as app
+
+# Индекс апдейта, который сейчас обрабатывается — чтобы считать запросы к API
+current_replay_index: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_replay_index", default=None,
+)
+
+# ─────────────────────────────────────────────
+#  Фейковый Bot API
+# ─────────────────────────────────────────────
+class FakeBotAPISession(BaseSession):
+    """Отвечает на запросы правдоподобными объектами, ничего не отправляя."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: dict[int, list[str]] = {}
+        self._message_id = 0
+
+    def _fake_message(self, method) -> Message:
+        self._message_id += 1
+        chat_id = getattr(method, "chat_id", 0)
+        return Message(
+            message_id=self._message_id,
+            date=datetime.utcnow(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+            text=getattr(method, "text", None),
+        )
+
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None) -> Any:
+        index = current_replay_index.get()
+        if index is not None:
+            self.calls.setdefault(index, []).append(type(method).__name__)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        returning = method.__returning__
+        if returning is Message or Message in typing.get_args(returning):
+            return self._fake_message(method)
+        return True
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+# ─────────────────────────────────────────────
+#  Replay
+# ─────────────────────────────────────────────
+def load_records(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+async def replay(records: list[dict], speed: float, session: FakeBotAPISession) -> dict:
+    bots: dict[int, Bot] = {}
+    for record in records:
+        bot_id = record["bot_id"]
+        if bot_id not in bots:
+            bots[bot_id] = Bot(token=f"{bot_id}:REPLAY", session=session)
+    app.bots_by_id.update(bots)
+
+    latencies: list[float] = [0.0] * len(records)
+
+    async def feed(index: int, record: dict) -> None:
+        current_replay_index.set(index)
+        started = time.perf_counter()
+        try:
+            await app.dp.feed_raw_update(bots[record["bot_id"]], record["update"])
+        except Exception as e:
+            logging.warning("update #%s failed: %s", index, e)
+        latencies[index] = (time.perf_counter() - started) * 1000
+
+    first_ts = records[0]["ts"] if records else 0.0
+    wall_start = time.perf_counter()
+    tasks = []
+    for index, record in enumerate(records):
+        if speed > 0:
+            due = (record["ts"] - first_ts) / speed
+            delay = due - (time.perf_counter() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(feed(index, record)))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - wall_start
+
+    api_calls = [session.calls.get(i, []) for i in range(len(records))]
+    methods = Counter(name for calls in api_calls for name in calls)
+    return {
+        "summary": {
+            "updates":          len(records),
+            "wall_seconds":     round(wall, 3),
+            "throughput":       round(len(records) / wall, 1) if wall else 0.0,
+            "latency_p50_ms":   round(percentile(latencies, 50), 2),
+            "latency_p90_ms":   round(percentile(latencies, 90), 2),
+            "latency_p99_ms":   round(percentile(latencies, 99), 2),
+            "latency_max_ms":   round(max(latencies, default=0.0), 2),
+            "api_per_update":   round(sum(map(len, api_calls)) / len(records), 2) if records else 0.0,
+            "api_methods":      dict(methods.most_common()),
+            "shed":             app.admission.stats["shed"],
+        },
+        "updates": [
+            {"index": i, "latency_ms": round(latencies[i], 3), "api": api_calls[i]}
+            for i in range(len(records))
+        ],
+    }
+
+def count_divergences(current: dict, previous: dict) -> list[int]:
+    """Индексы апдейтов, у которых последовательность вызовов API отличается."""
+    prev_api = {u["index"]: u["api"] for u in previous["updates"]}
+    return [u["index"] for u in current["updates"] if prev_api.get(u["index"]) != u["api"]]
+
+def print_report(result: dict, divergences: Optional[list[int]]) -> None:
+    s = result["summary"]
+    print(f"Апдейтов:         {s['updates']} за {s['wall_seconds']} с ({s['throughput']}/с)")
+    print(
+        f"Латентность, мс:  p50={s['latency_p50_ms']} p90={s['latency_p90_ms']} "
+        f"p99={s['latency_p99_ms']} max={s['latency_max_ms']}"
+    )
+    print(f"API на апдейт:    {s['api_per_update']}")
+    for name, count in s["api_methods"].items():
+        print(f"  {name}: {count}")
+    print(f"Сброшено:         {s['shed']}")
+    if divergences is not None:
+        print(f"Расхождений с предыдущим прогоном: {len(divergences)}")
+        if divergences:
+            print("  индексы: " + ", ".join(map(str, divergences[:20])))
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay записанных апдейтов")
+    parser.add_argument("path", help="JSONL от UpdateRecorderMiddleware")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="множитель темпа; 0 — без пауз (по умолчанию 1)")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="искусственная задержка фейкового API, мс")
+    parser.add_argument("--backup-dir", help="поднять БД из автобэкапов перед прогоном")
+    parser.add_argument("--save", help="сохранить результат в JSON")
+    parser.add_argument("--compare", help="сравнить с сохранённым результатом")
+    args = parser.parse_args()
+
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    app.db_init()
+    if args.backup_dir:
+        app.BACKUP_DIR = args.backup_dir
+        await app.restore_backups()
+
+    session = FakeBotAPISession(latency=args.api_latency / 1000)
+    session.middleware(app.ApiTracingMiddleware())
+    result = await replay(load_records(args.path), args.speed, session)
+
+    divergences = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            divergences = count_divergences(result, json.load(f))
+    print_report(result, divergences)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+
+if __name__ == "__main__":
+    asyncio.run(main())